@@ -0,0 +1,133 @@
+"""消息规范化微基准：对比入库路径中旧的内联写法与 normalizer 模块的单核吞吐（events/sec）。
+
+用法：python benchmarks/bench_normalizer.py [--events 200000] [--no-orjson]
+
+只测纯计算部分（解析 raw_message、遍历消息段、生成文本、序列化 raw_message），不含媒体下载与数据库写入。
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import normalizer  # noqa: E402
+
+
+def _sample_events():
+    return [
+        # 纯文本（raw_message 为对象）
+        ({"post_type": "message", "message": [{"type": "text", "data": {"text": "早上好"}}]}, "早上好"),
+        # 图片 + 文本（raw_message 为 JSON 字符串）
+        (json.dumps({"post_type": "message", "message": [
+            {"type": "image", "data": {"file": "a.jpg", "url": "https://example.com/a.jpg"}},
+            {"type": "text", "data": {"text": "看这个"}},
+        ]}, ensure_ascii=False), "[图片]看这个"),
+        # 回复 + @ + 表情，文本为空
+        ({"post_type": "message", "message": [
+            {"type": "reply", "data": {"id": "1"}},
+            {"type": "at", "data": {"qq": "10000"}},
+            {"type": "face", "data": {"id": "14"}},
+        ]}, ""),
+        # 视频文件
+        ({"post_type": "message", "message": [
+            {"type": "file", "data": {"name": "clip.MP4", "url": "https://example.com/clip.mp4"}},
+        ]}, "[文件]"),
+        # 通知
+        ({"post_type": "notice", "notice_type": "group_ban", "sub_type": "ban"}, ""),
+        ({"post_type": "notice", "notice_type": "group_recall", "operator_id": 1, "user_id": 2, "message_id": 3}, ""),
+    ]
+
+
+def legacy_normalize(raw_message, message_str):
+    """入库路径旧写法的纯计算部分（假定媒体均下载成功）"""
+    raw_data = raw_message
+    if isinstance(raw_data, str):
+        try:
+            raw_data = json.loads(raw_data)
+        except Exception:
+            pass
+
+    comp_types, media = [], []
+    final_message_str = message_str.strip()
+    if isinstance(raw_data, dict) and raw_data.get("post_type") == "notice":
+        notice_type = raw_data.get("notice_type", "")
+        sub_type = raw_data.get("sub_type", "")
+        if notice_type == "group_ban":
+            final_message_str = f"[群内发生了{'禁言' if sub_type == 'ban' else '解除禁言'}操作]"
+        elif notice_type in ["group_recall", "friend_recall"]:
+            operator_id, user_id = raw_data.get("operator_id"), raw_data.get("user_id")
+            if notice_type == "group_recall" and str(operator_id) != str(user_id):
+                final_message_str = f"[管理员撤回了 {user_id} 的消息]"
+            else:
+                final_message_str = f"[{user_id} 撤回了一条消息]"
+        else:
+            final_message_str = f"[系统通知: {notice_type}]"
+    else:
+        msg_list = raw_data.get("message", raw_data) if isinstance(raw_data, dict) else raw_data
+        if isinstance(msg_list, list):
+            for segment in msg_list:
+                if not isinstance(segment, dict): continue
+                seg_type = segment.get("type", "")
+                comp_types.append(seg_type)
+                data = segment.get("data", {})
+                url = data.get("url") or data.get("file") or data.get("file_id")
+                if url and isinstance(url, str) and url.startswith("http"):
+                    if seg_type == "video" or (seg_type == "file" and str(data.get("name", url)).lower().endswith(('.mp4', '.mov', '.avi', '.mkv'))):
+                        media.append(("video", url))
+                    elif seg_type == "image":
+                        media.append(("image", url))
+        if media:
+            final_message_str = re.sub(r'\[(File|Video|Image|文件|视频|图片|不支持的格式.*?)\]', '', final_message_str, flags=re.IGNORECASE).strip()
+        if not final_message_str and not media:
+            segment_msg_map = {
+                "record": "[语音消息]", "video": "[视频获取失败]", "face": "[QQ表情]", "mface": "[商城表情]",
+                "share": "[分享链接]", "music": "[音乐卡片]", "reply": "[回复消息]", "forward": "[合并转发记录]",
+                "xml": "[卡片消息 (XML)]", "json": "[卡片消息 (JSON)]", "poke": "[拍了拍/戳一戳]",
+                "nudge": "[拍了拍/戳一戳]", "location": "[位置分享]", "gift": "[群礼物]",
+            }
+            for c_type in [t.lower() for t in comp_types]:
+                if c_type in segment_msg_map:
+                    final_message_str = segment_msg_map[c_type]
+                    break
+
+    raw_str = json.dumps(raw_message, ensure_ascii=False) if not isinstance(raw_message, str) else raw_message
+    return final_message_str, media, raw_str
+
+
+def current_normalize(raw_message, message_str):
+    text, media = normalizer.normalize_offline(raw_message, message_str)
+    return text, media, normalizer.serialize_raw(raw_message)
+
+
+def run(func, events, total):
+    n = len(events)
+    start = time.perf_counter()
+    for i in range(total):
+        raw, text = events[i % n]
+        func(raw, text)
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--no-orjson", action="store_true", help="强制使用标准库 json")
+    args = parser.parse_args()
+
+    if args.no_orjson and normalizer.orjson is not None:
+        normalizer.loads = json.loads
+        normalizer.dumps = normalizer._json_encode
+
+    events = _sample_events()
+    use_orjson = normalizer.orjson is not None and not args.no_orjson
+    print(f"python {sys.version.split()[0]}, orjson: {'on' if use_orjson else 'off'}, events: {args.events}")
+    for name, func in (("legacy", legacy_normalize), ("normalizer", current_normalize)):
+        run(func, events, min(args.events, 10000))  # 预热
+        print(f"{name:>10}: {run(func, events, args.events):,.0f} events/sec/core")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import bisect
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+from .normalizer import dumps
+
+
+class HotMessageCache:
+    """按会话缓存最近入库的消息（已序列化为 JSON 字符串），供 WebUI 热读取。
+
+    - 每个会话最多保留 per_conv_limit 条，超出后自动挤掉最旧的
+    - 全局占用超过 max_bytes 时，按最久未访问的会话整体淘汰
+    - 超过 idle_seconds 未读写的会话会被清理
+
+    缓存内按 (timestamp, message_id) 排序，与数据库的 ORDER BY created_time, message_id 保持一致，
+    入库完成的先后顺序（例如带视频的旧消息下载较慢）不影响结果。
+    """
+
+    def __init__(self, per_conv_limit: int = 1000, max_bytes: int = 32 * 1024 * 1024, idle_seconds: int = 1800):
+        self.per_conv_limit = max(1, int(per_conv_limit))
+        self.max_bytes = max(0, int(max_bytes))
+        self.idle_seconds = max(0, int(idle_seconds))
+
+        # conv_id -> deque[(timestamp, message_id, json_str)]，按时间升序，最新的在右侧
+        self._buffers: "OrderedDict[str, deque]" = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._bytes: Dict[str, int] = {}
+        self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._buffers)
+
+    def _touch(self, conv_id: str):
+        self._buffers.move_to_end(conv_id)
+        self._last_access[conv_id] = time.monotonic()
+
+    def _drop(self, conv_id: str):
+        self._buffers.pop(conv_id, None)
+        self._last_access.pop(conv_id, None)
+        self.total_bytes -= self._bytes.pop(conv_id, 0)
+
+    def _evict(self, keep: Optional[str] = None):
+        # 清理闲置会话：_buffers 按访问时间排序，从头部弹出直到遇到未闲置的会话
+        if self.idle_seconds:
+            deadline = time.monotonic() - self.idle_seconds
+            while self._buffers:
+                oldest = next(iter(self._buffers))
+                if oldest == keep or self._last_access.get(oldest, 0) >= deadline:
+                    break
+                self._drop(oldest)
+
+        # 超出全局内存上限时，从最久未访问的会话开始整体淘汰
+        while self.max_bytes and self.total_bytes > self.max_bytes and self._buffers:
+            oldest = next(iter(self._buffers))
+            if oldest == keep:
+                if len(self._buffers) == 1:
+                    break
+                self._buffers.move_to_end(oldest)
+                continue
+            self._drop(oldest)
+
+    def append(self, conv_ids, timestamp: int, message_id: str, row: dict):
+        """写入一条已入库的消息，row 的结构需与 /api/messages 返回的单条数据一致"""
+        encoded = dumps(row)
+        size = len(encoded)
+        entry = (int(timestamp), str(message_id), encoded)
+
+        for conv_id in dict.fromkeys(str(c) for c in conv_ids if c):
+            buf = self._buffers.get(conv_id)
+            if buf is None:
+                buf = deque()
+                self._buffers[conv_id] = buf
+                self._bytes[conv_id] = 0
+
+            # 绝大多数消息按时间顺序到达，直接追加；迟到的消息插入到正确位置
+            if not buf or buf[-1] <= entry:
+                buf.append(entry)
+            else:
+                buf.insert(bisect.bisect_right(buf, entry), entry)
+            self._bytes[conv_id] += size
+            self.total_bytes += size
+
+            while len(buf) > self.per_conv_limit:
+                _, _, old = buf.popleft()
+                self._bytes[conv_id] -= len(old)
+                self.total_bytes -= len(old)
+
+            self._touch(conv_id)
+            self._evict(keep=conv_id)
+
+    def latest(self, conv_id: str, limit: int) -> Optional[List[str]]:
+        """返回最新的 limit 条（新 -> 旧），缓存不足以覆盖时返回 None 交由数据库查询"""
+        buf = self._buffers.get(str(conv_id))
+        if buf is None or limit <= 0 or len(buf) < limit:
+            return None
+        self._touch(str(conv_id))
+        return [encoded for _, _, encoded in list(buf)[-limit:]][::-1]
+
+    def newer_than(self, conv_id: str, cursor_id: str, limit: int) -> Optional[List[str]]:
+        """返回游标之后的消息（新 -> 旧），游标不在缓存中时返回 None 交由数据库查询"""
+        buf = self._buffers.get(str(conv_id))
+        if buf is None:
+            return None
+        cursor_id = str(cursor_id)
+
+        newer = []
+        for _, message_id, encoded in reversed(buf):
+            if message_id == cursor_id:
+                self._touch(str(conv_id))
+                return newer[:limit] if limit > 0 else newer
+            newer.append(encoded)
+        return None
+
+    def invalidate(self, conv_id: Optional[str] = None):
+        if conv_id is None:
+            self._buffers.clear()
+            self._last_access.clear()
+            self._bytes.clear()
+            self.total_bytes = 0
+        else:
+            self._drop(str(conv_id))
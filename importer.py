@@ -0,0 +1,108 @@
+import re
+from pathlib import Path
+from typing import List, Tuple
+
+from .normalizer import loads
+
+# [CQ:type,key=value,...]
+_CQ_RE = re.compile(r"\[CQ:([A-Za-z_]+)((?:,[^,\]]*)*)\]")
+
+
+def _cq_unescape(text: str) -> str:
+    return text.replace("&#44;", ",").replace("&#91;", "[").replace("&#93;", "]").replace("&amp;", "&")
+
+
+def parse_cq_message(text: str) -> List[dict]:
+    """把 CQ 码字符串解析为 OneBot 消息段数组"""
+    segments, pos = [], 0
+    for m in _CQ_RE.finditer(text):
+        if m.start() > pos:
+            segments.append({"type": "text", "data": {"text": _cq_unescape(text[pos:m.start()])}})
+        data = {}
+        for pair in m.group(2).split(",")[1:]:
+            key, _, value = pair.partition("=")
+            data[key] = _cq_unescape(value)
+        segments.append({"type": m.group(1), "data": data})
+        pos = m.end()
+    if pos < len(text):
+        segments.append({"type": "text", "data": {"text": _cq_unescape(text[pos:])}})
+    return segments
+
+
+def message_segments(event: dict) -> List[dict]:
+    """取出 OneBot 消息事件的消息段，兼容数组与 CQ 码字符串两种格式"""
+    message = event.get("message")
+    if isinstance(message, list):
+        return message
+    if isinstance(message, str):
+        return parse_cq_message(message)
+    raw_message = event.get("raw_message")
+    if isinstance(raw_message, str):
+        return parse_cq_message(raw_message)
+    return []
+
+
+def plain_text(segments: List[dict]) -> str:
+    """拼出与框架 message_str 相近的纯文本（文本段与 @）"""
+    parts = []
+    for segment in segments:
+        if not isinstance(segment, dict):
+            continue
+        seg_type = segment.get("type")
+        data = segment.get("data") or {}
+        if seg_type == "text":
+            parts.append(str(data.get("text", "")))
+        elif seg_type == "at":
+            parts.append(f"@{data.get('name') or data.get('qq', '')} ")
+    return "".join(parts)
+
+
+def _unwrap_messages(payload) -> list:
+    # 兼容 [...]、{"messages": [...]}、{"data": {"messages": [...]}} 以及 get_group_msg_history 的原样返回
+    if isinstance(payload, list):
+        return payload
+    if isinstance(payload, dict):
+        if isinstance(payload.get("messages"), list):
+            return payload["messages"]
+        if "data" in payload:
+            return _unwrap_messages(payload["data"])
+    return []
+
+
+def is_ndjson(path: Path) -> bool:
+    return path.suffix.lower() in (".ndjson", ".jsonl")
+
+
+def read_ndjson_batch(path: Path, offset: int, batch_size: int) -> Tuple[List[dict], int, List[int]]:
+    """从字节偏移 offset 处读取至少 batch_size 条记录（读到文件末尾为止），返回 (记录, 下一批的字节偏移, 无法解析的行的偏移)。
+
+    同步函数，请放在线程中调用；偏移量可直接作为断点，续传时 seek 过去即可，无需重新解析之前的内容。
+    无法解析的行会被跳过，不会让整个导入卡在同一位置。
+    """
+    records, bad_lines = [], []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while len(records) < batch_size:
+            line_offset = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = loads(line)
+            except ValueError:
+                bad_lines.append(line_offset)
+                continue
+            if isinstance(record, dict) and "message_id" not in record:
+                records.extend(_unwrap_messages(record))
+            else:
+                records.append(record)
+        return records, f.tell(), bad_lines
+
+
+def load_export_document(path: Path) -> list:
+    """整体读取并解析 JSON 导出文件（同步函数，请放在线程中调用）。超大导出请使用 NDJSON 以便流式读取"""
+    with open(path, "rb") as f:
+        return _unwrap_messages(loads(f.read()))
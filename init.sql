@@ -2,7 +2,7 @@
 CREATE TABLE IF NOT EXISTS image_assets (
     image_hash   VARCHAR(64) PRIMARY KEY,
     file_path    TEXT NOT NULL,
-    file_size    INT,
+    file_size    BIGINT,
     created_time DATETIME NOT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
@@ -10,11 +10,29 @@ CREATE TABLE IF NOT EXISTS image_assets (
 CREATE TABLE IF NOT EXISTS video_assets (
     video_hash   VARCHAR(64) PRIMARY KEY,
     file_path    TEXT NOT NULL,
-    file_size    INT,
+    file_size    BIGINT,
     created_time DATETIME NOT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
--- 3. 消息主表
+-- 3. 群媒体配额账本（按月累计）
+CREATE TABLE IF NOT EXISTS media_quota (
+    group_id     VARCHAR(191) NOT NULL,
+    month        VARCHAR(7) NOT NULL,
+    bytes_used   BIGINT NOT NULL DEFAULT 0,
+    updated_time DATETIME NOT NULL,
+    PRIMARY KEY (group_id, month)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- 4. 历史消息导入断点
+CREATE TABLE IF NOT EXISTS import_checkpoints (
+    source       VARCHAR(191) PRIMARY KEY,
+    position     VARCHAR(64),
+    imported     BIGINT NOT NULL DEFAULT 0,
+    finished     BOOLEAN DEFAULT FALSE,
+    updated_time DATETIME NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- 5. 消息主表
 CREATE TABLE IF NOT EXISTS messages (
     message_id    VARCHAR(191) PRIMARY KEY,
     platform_type VARCHAR(50) NOT NULL,
@@ -12,11 +12,23 @@ from aiohttp import web
 import aiofiles
 import hashlib
 import datetime
-import re  
+import shutil
+import uuid
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Tuple
 import asyncio
 
+from .hot_cache import HotMessageCache
+from .media_store import (MediaScrubber, TEMP_DIR_NAME, extract_poster_frame, hash_file, prune_empty_dirs,
+                          shard_path, sniff_ext)
+from .importer import is_ndjson, load_export_document, message_segments, plain_text, read_ndjson_batch
+from . import normalizer
+
+
+class _DownloadAborted(Exception):
+    """下载因超出大小限制等原因被主动中止"""
+
+
 @register("web_archive", "yueye109", "MySQL存档+ 独立WebUI", "1.0.0")
 class MySQLPlugin(Star):
     def __init__(self, context: Context, config: AstrBotConfig):
@@ -38,8 +50,38 @@ class MySQLPlugin(Star):
         self.video_save_path = Path(vid_path_str) if vid_path_str else (root_dir / "data" / "chat_videos")
         self.video_save_path = self.video_save_path.absolute()
 
+        # 媒体下载限制：单文件大小上限与总耗时上限（0 表示不限制）
+        self.image_max_bytes = int(float(self.config.get("image_max_mb", 20)) * 1024 * 1024)
+        self.video_max_bytes = int(float(self.config.get("video_max_mb", 200)) * 1024 * 1024)
+        self.image_timeout = float(self.config.get("image_timeout", 60))
+        self.video_timeout = float(self.config.get("video_timeout", 300))
+        # 视频存储方式：full 完整保存 / truncate 只保留前 N MB / poster 只保留首帧封面
+        self.video_store_mode = str(self.config.get("video_store_mode", "full")).strip().lower()
+        self.video_truncate_bytes = int(float(self.config.get("video_truncate_mb", 20)) * 1024 * 1024)
+        self.ffmpeg_path = shutil.which("ffmpeg")
+        self.ffmpeg_semaphore = asyncio.Semaphore(max(1, int(self.config.get("ffmpeg_workers", 2))))
+        # 每个群每月的媒体配额（0 表示不限制）
+        self.group_quota_bytes = int(float(self.config.get("group_quota_mb", 0)) * 1024 * 1024)
+
         self.auto_cleanup = self.config.get("auto_cleanup", True)
         self.keep_days = self.config.get("keep_days", 60)
+
+        # 热数据缓存：各会话最近的消息直接驻留内存，WebUI 读取最新消息时免查库
+        self.hot_cache = HotMessageCache(
+            per_conv_limit=int(self.config.get("hot_cache_size", 1000)),
+            max_bytes=int(self.config.get("hot_cache_max_mb", 32)) * 1024 * 1024,
+            idle_seconds=int(self.config.get("hot_cache_idle_minutes", 30)) * 60
+        )
+
+        # 媒体完整性巡检（0 表示不自动巡检）
+        self.scrub_interval_hours = float(self.config.get("scrub_interval_hours", 168))
+        self.scrub_files_per_second = float(self.config.get("scrub_files_per_second", 20))
+        self.scrubber: Optional[MediaScrubber] = None
+
+        # 历史消息导入：每批条数与媒体下载并发数
+        self.import_batch_size = max(1, int(self.config.get("import_batch_size", 100)))
+        self.import_concurrency = max(1, int(self.config.get("import_concurrency", 8)))
+        self.running_imports = set()
         
         # WebUI 配置与前端模板目录初始化
         self.web_port = self.config.get("web_port", 8055)
@@ -49,6 +91,7 @@ class MySQLPlugin(Star):
         self.whitelist_file = Path(__file__).parent / "whitelist.json"
         self.whitelist_file.parent.mkdir(parents=True, exist_ok=True)
         self.qq_group_map = self._load_whitelist()
+        self.group_name_cache = {}
 
         asyncio.create_task(self._init_db_and_tasks())
 
@@ -97,6 +140,17 @@ class MySQLPlugin(Star):
                                 await cursor.execute(statement)
                         logger.info(">>> 数据库表结构初始化完成")
                     
+                    # 旧版 file_size 为 INT，超过 2GB 会溢出
+                    for asset_table in ("image_assets", "video_assets"):
+                        await cursor.execute("""
+                            SELECT DATA_TYPE FROM information_schema.COLUMNS
+                            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = 'file_size'
+                        """, (asset_table,))
+                        row = await cursor.fetchone()
+                        if row and str(row[0]).lower() == "int":
+                            await cursor.execute(f"ALTER TABLE {asset_table} MODIFY file_size BIGINT")
+                            logger.info(f">>> {asset_table}.file_size 已升级为 BIGINT")
+
                     # 索引
                     try:
                         await cursor.execute("CREATE INDEX idx_group_session ON messages (group_id(50), session_id(50));")
@@ -107,6 +161,13 @@ class MySQLPlugin(Star):
 
             if self.auto_cleanup:
                 asyncio.create_task(self._cleanup_loop())
+
+            self.scrubber = MediaScrubber(self.pool, {
+                "image_assets": self.image_save_path,
+                "video_assets": self.video_save_path
+            }, files_per_second=self.scrub_files_per_second)
+            if self.scrub_interval_hours > 0:
+                asyncio.create_task(self._scrub_loop())
             
             # 启动内置 WebUI
             asyncio.create_task(self._start_webui())
@@ -245,6 +306,7 @@ class MySQLPlugin(Star):
         req_pwd = data.get('pwd', '')
         target_id = data.get('target_id', '') 
         target_date = data.get('date', '')    
+        after_id = str(data.get('after_id', '') or '')
 
         if not target_id:
             return web.json_response({"status": "success", "data": []})
@@ -259,6 +321,16 @@ class MySQLPlugin(Star):
         if not is_admin and target_id not in allowed_groups:
             return web.json_response({"status": "error", "message": "无权限查看该群", "data": []})
 
+        # 优先命中热数据缓存（仅限不按日期过滤的最新消息 / 游标之后的新消息）
+        if not target_date:
+            if after_id:
+                cached = self.hot_cache.newer_than(target_id, after_id, limit)
+            else:
+                cached = self.hot_cache.latest(target_id, limit)
+            if cached is not None:
+                body = '{"status": "success", "data": [' + ', '.join(cached) + ']}'
+                return web.Response(text=body, content_type='application/json')
+
         async with self.pool.acquire() as conn:
             async with conn.cursor(DictCursor) as cursor:
                 base_query = """
@@ -273,7 +345,15 @@ class MySQLPlugin(Star):
                     base_query += " AND created_time LIKE %s"
                     params.append(f"{target_date}%")
 
-                base_query += " ORDER BY created_time DESC LIMIT %s"
+                # 只取游标消息之后的新消息（与排序一致按 (created_time, message_id) 比较）；游标不存在时退化为最新消息
+                if after_id:
+                    await cursor.execute("SELECT created_time FROM messages WHERE message_id = %s", (after_id,))
+                    cursor_row = await cursor.fetchone()
+                    if cursor_row:
+                        base_query += " AND (created_time > %s OR (created_time = %s AND message_id > %s))"
+                        params.extend([cursor_row['created_time'], cursor_row['created_time'], after_id])
+
+                base_query += " ORDER BY created_time DESC, message_id DESC LIMIT %s"
                 params.append(limit)
 
                 await cursor.execute(base_query, tuple(params))
@@ -308,79 +388,267 @@ class MySQLPlugin(Star):
         return web.Response(status=404, text="Video Not Found")
 
     # ------------------ 资源下载逻辑 ------------------
-    async def _download_and_store(self, url: str, base_save_path: Path, asset_table: str, sub_folder: str) -> Optional[str]:
-        if not url: return None
+    async def _quota_remaining(self, group_id: Optional[str], month: str) -> Optional[int]:
+        """返回该群本月剩余的媒体配额（字节），未开启配额时返回 None"""
+        if not self.group_quota_bytes or not group_id:
+            return None
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute("SELECT bytes_used FROM media_quota WHERE group_id=%s AND month=%s", (group_id, month[:7]))
+                row = await cursor.fetchone()
+        return self.group_quota_bytes - int(row[0] if row else 0)
+
+    async def _download_to_temp(self, url: str, temp_dir: Path, max_bytes: int, timeout: float, truncate: bool = False):
+        """流式下载到临时文件，超出 max_bytes 时提前中止（truncate=True 时只保留前 max_bytes 字节）。
+
+        成功返回 (临时文件路径, sha256, 文件大小, 文件头)，失败或超限返回 None。
+        """
+        temp_dir.mkdir(parents=True, exist_ok=True)
+        temp_file_path = temp_dir / f"temp_{uuid.uuid4().hex}.tmp"
         try:
             sha256_obj = hashlib.sha256()
-            temp_file_name = f"temp_{datetime.datetime.now().timestamp()}.tmp"
-            
-            target_dir = base_save_path / sub_folder
-            target_dir.mkdir(parents=True, exist_ok=True)
-            temp_file_path = target_dir / temp_file_name
-
             file_size = 0
             header_bytes = b"" 
-            
-            async with aiohttp.ClientSession() as session:
+
+            client_timeout = aiohttp.ClientTimeout(total=timeout) if timeout and timeout > 0 else None
+            async with aiohttp.ClientSession(timeout=client_timeout) as session:
                 async with session.get(url) as resp:
                     if resp.status != 200: return None
+
+                    # 根据响应头提前拒绝
+                    if max_bytes and not truncate and resp.content_length and resp.content_length > max_bytes:
+                        logger.info(f"媒体超出大小限制 ({resp.content_length} > {max_bytes} 字节)，跳过: {url}")
+                        return None
                     
                     async with aiofiles.open(temp_file_path, mode='wb') as f:
                         async for chunk in resp.content.iter_chunked(65536):
+                            if max_bytes and file_size + len(chunk) > max_bytes:
+                                if not truncate:
+                                    logger.info(f"媒体下载超出大小限制 ({max_bytes} 字节)，已中止: {url}")
+                                    raise _DownloadAborted()
+                                chunk = chunk[:max_bytes - file_size]
                             if file_size == 0:
                                 header_bytes = chunk[:12]
                             await f.write(chunk)
                             sha256_obj.update(chunk)
                             file_size += len(chunk)
+                            if max_bytes and file_size >= max_bytes and truncate:
+                                break
+
+            if file_size == 0:
+                raise _DownloadAborted()
+            return temp_file_path, sha256_obj.hexdigest(), file_size, header_bytes
+
+        except _DownloadAborted:
+            pass
+        except asyncio.TimeoutError:
+            logger.info(f"媒体下载超时 ({timeout}s)，已中止: {url}")
+        except Exception as e:
+            logger.error(f"下载失败 {url}: {e}")
 
-            sha256_hash = sha256_obj.hexdigest()
+        if temp_file_path.exists():
+            temp_file_path.unlink()
+        return None
 
+    async def _store_asset_file(self, temp_file_path: Path, sha256_hash: str, file_size: int, header_bytes: bytes,
+                                base_save_path: Path, asset_table: str, group_id: Optional[str], month: str) -> Optional[str]:
+        """把临时文件登记为资产（已存在则直接丢弃临时文件），并计入群配额账本"""
+        hash_column = f"{asset_table[:-7]}_hash"
+        try:
             async with self.pool.acquire() as conn:
                 async with conn.cursor() as cursor:
-                    await cursor.execute(f"SELECT file_path FROM {asset_table} WHERE {asset_table[:-7]}_hash=%s", (sha256_hash,))
+                    await cursor.execute(f"SELECT file_path FROM {asset_table} WHERE {hash_column}=%s", (sha256_hash,))
                     if await cursor.fetchone():
                         if temp_file_path.exists():
                             temp_file_path.unlink()
                         return sha256_hash
 
-                    file_ext = ".dat"
-                    if asset_table == "image_assets":
-                        if header_bytes[:4].startswith(b'\x89PNG'): file_ext = ".png"
-                        elif header_bytes[:3].startswith(b'GIF'): file_ext = ".gif"
-                        elif header_bytes[:4].startswith(b'RIFF') and header_bytes[8:12] == b'WEBP': file_ext = ".webp"
-                        else: file_ext = ".jpg"
-                    elif asset_table == "video_assets":
-                        file_ext = ".mp4"
-
-                    file_name = f"{sha256_hash}{file_ext}"
-                    abs_path = str(target_dir / file_name)
+                    # 内容寻址：<base>/ab/cd/<sha256>.ext，相同内容永远落在同一位置
+                    target_path = shard_path(base_save_path, sha256_hash, sniff_ext(asset_table, header_bytes))
+                    target_path.parent.mkdir(parents=True, exist_ok=True)
+                    abs_path = str(target_path)
                     
-                    temp_file_path.rename(abs_path)
+                    os.replace(temp_file_path, abs_path)
 
                     await cursor.execute(f"""
-                        INSERT INTO {asset_table} ({asset_table[:-7]}_hash, file_path, file_size, created_time)
+                        INSERT IGNORE INTO {asset_table} ({hash_column}, file_path, file_size, created_time)
                         VALUES (%s, %s, %s, %s)
                     """, (sha256_hash, abs_path, file_size, datetime.datetime.now()))
+
+                    if cursor.rowcount and self.group_quota_bytes and group_id:
+                        await cursor.execute("""
+                            INSERT INTO media_quota (group_id, month, bytes_used, updated_time)
+                            VALUES (%s, %s, %s, %s)
+                            ON DUPLICATE KEY UPDATE bytes_used = bytes_used + VALUES(bytes_used), updated_time = VALUES(updated_time)
+                        """, (group_id, month[:7], file_size, datetime.datetime.now()))
                     
                     return sha256_hash
 
         except Exception as e:
-            logger.error(f"下载/存储失败 {url}: {e}")
-            if 'temp_file_path' in locals() and temp_file_path.exists():
+            logger.error(f"存储失败 {sha256_hash}: {e}")
+            if temp_file_path.exists():
                 temp_file_path.unlink()
             return None
 
-    async def _process_image(self, url: str, sub_folder: str) -> Optional[str]:
+    async def _download_and_store(self, url: str, base_save_path: Path, asset_table: str, group_id: Optional[str], month: str,
+                                  max_bytes: int = 0, timeout: float = 0, truncate: bool = False) -> Optional[str]:
+        if not url: return None
+
+        remaining = await self._quota_remaining(group_id, month)
+        if remaining is not None:
+            if remaining <= 0:
+                logger.info(f"群 {group_id} 本月媒体配额已用尽，跳过: {url}")
+                return None
+            max_bytes = min(max_bytes, remaining) if max_bytes else remaining
+
+        downloaded = await self._download_to_temp(url, base_save_path / TEMP_DIR_NAME, max_bytes, timeout, truncate)
+        if not downloaded:
+            return None
+        temp_file_path, sha256_hash, file_size, header_bytes = downloaded
+        return await self._store_asset_file(temp_file_path, sha256_hash, file_size, header_bytes,
+                                            base_save_path, asset_table, group_id, month)
+
+    async def _process_image(self, url: str, group_id: Optional[str], month: str) -> Optional[str]:
         if self.is_save_image:
-            return await self._download_and_store(url, self.image_save_path, "image_assets", sub_folder)
+            return await self._download_and_store(url, self.image_save_path, "image_assets", group_id, month,
+                                                  self.image_max_bytes, self.image_timeout)
         return None
 
-    async def _process_video(self, url: str, sub_folder: str) -> Optional[str]:
-        if self.is_save_video:
-            return await self._download_and_store(url, self.video_save_path, "video_assets", sub_folder)
+    async def _process_video(self, url: str, group_id: Optional[str], month: str) -> Tuple[str, Optional[str]]:
+        """按 video_store_mode 存储视频，返回 (资产类型, 哈希)；poster 模式下存的是封面图片"""
+        if not self.is_save_video:
+            return "video", None
+        if self.video_store_mode == "poster":
+            return "image", await self._process_video_poster(url, group_id, month)
+        if self.video_store_mode == "truncate" and self.video_truncate_bytes:
+            return "video", await self._download_and_store(url, self.video_save_path, "video_assets", group_id, month,
+                                                           self.video_truncate_bytes, self.video_timeout, truncate=True)
+        return "video", await self._download_and_store(url, self.video_save_path, "video_assets", group_id, month,
+                                                       self.video_max_bytes, self.video_timeout)
+
+    async def _probe_content_length(self, url: str) -> Optional[int]:
+        """HEAD 请求获取资源大小，获取不到时返回 None"""
+        try:
+            client_timeout = aiohttp.ClientTimeout(total=min(self.video_timeout or 30, 30))
+            async with aiohttp.ClientSession(timeout=client_timeout) as session:
+                async with session.head(url, allow_redirects=True) as resp:
+                    if resp.status == 200:
+                        return resp.content_length
+        except Exception as e:
+            logger.debug(f"获取视频大小失败 {url}: {e}")
         return None
 
+    async def _process_video_poster(self, url: str, group_id: Optional[str], month: str) -> Optional[str]:
+        """只保留视频首帧：由本地 ffmpeg 进程池直接读取 URL 截图（按需 Range 读取，无需整段下载），原视频不落盘"""
+        if not self.ffmpeg_path:
+            logger.warning("未找到 ffmpeg，无法生成视频封面，已跳过视频存储")
+            return None
+
+        if not url.lower().startswith(("http://", "https://")):
+            return None
+
+        remaining = await self._quota_remaining(group_id, month)
+        if remaining is not None and remaining <= 0:
+            logger.info(f"群 {group_id} 本月媒体配额已用尽，跳过视频封面: {url}")
+            return None
+
+        # ffmpeg 本身没有字节上限，先用 HEAD 按 video_max_mb 拒绝过大的视频
+        if self.video_max_bytes:
+            content_length = await self._probe_content_length(url)
+            if content_length and content_length > self.video_max_bytes:
+                logger.info(f"视频超出大小限制 ({content_length} > {self.video_max_bytes} 字节)，跳过封面: {url}")
+                return None
+
+        temp_poster_path = self.image_save_path / TEMP_DIR_NAME / f"poster_{uuid.uuid4().hex}.jpg"
+        try:
+            async with self.ffmpeg_semaphore:
+                ok = await extract_poster_frame(self.ffmpeg_path, url, temp_poster_path, timeout=self.video_timeout or 60)
+            if not ok:
+                logger.info(f"视频封面生成失败，已跳过: {url}")
+                return None
+            sha256_hash, file_size = await asyncio.to_thread(hash_file, temp_poster_path)
+            return await self._store_asset_file(temp_poster_path, sha256_hash, file_size, b"",
+                                                self.image_save_path, "image_assets", group_id, month)
+        finally:
+            if temp_poster_path.exists():
+                temp_poster_path.unlink()
+
     # ------------------ 消息入库逻辑 ------------------
+    async def _get_group_name(self, bot, group_id: str) -> str:
+        """获取并缓存群名，获取失败时退化为群号"""
+        if group_id in self.group_name_cache:
+            return self.group_name_cache[group_id]
+
+        group_name = group_id
+        try:
+            if bot is not None and hasattr(bot, 'api'):
+                api_ret = await bot.api.call_action('get_group_info', group_id=int(group_id), no_cache=False)
+                if isinstance(api_ret, dict):
+                    fetched_name = api_ret.get("data", api_ret).get("group_name")
+                    if fetched_name:
+                        group_name = fetched_name
+        except Exception:
+            pass
+
+        self.group_name_cache[group_id] = group_name
+        return group_name
+
+    def _grant_access(self, sender_id: str, target_id: str) -> bool:
+        """把会话加入发送者的白名单，有变化时返回 True（由调用方决定何时落盘）"""
+        if not sender_id or not target_id:
+            return False
+        groups = self.qq_group_map.setdefault(sender_id, [])
+        if target_id in groups:
+            return False
+        groups.append(target_id)
+        return True
+
+    async def _normalize_message(self, raw_data, message_str: str, components, target_id: str, msg_month: str,
+                                 fallback_nickname: Optional[str] = None) -> Tuple[str, list, list]:
+        """把一条原始消息/通知整理成入库文本，并下载其中的媒体，返回 (文本, 图片哈希列表, 视频哈希列表)
+
+        流程本身由 normalizer.normalize_steps 决定，这里只负责查库与下载。
+        """
+        image_hashes, video_hashes = [], []
+        steps = normalizer.normalize_steps(raw_data, message_str, components)
+        reply = None
+        try:
+            while True:
+                step, payload = steps.send(reply)
+                if step == normalizer.STEP_MEDIA:
+                    reply = await self._download_media(payload, target_id, msg_month, image_hashes, video_hashes)
+                else:
+                    reply = await self._lookup_recalled_nickname(payload, fallback_nickname)
+        except StopIteration as done:
+            return done.value, image_hashes, video_hashes
+
+    async def _lookup_recalled_nickname(self, recalled_msg_id: Optional[str], fallback_nickname: Optional[str]) -> Optional[str]:
+        """从数据库反查被撤回消息的发送者真实昵称"""
+        recalled_nickname = fallback_nickname
+        if recalled_msg_id:
+            try:
+                async with self.pool.acquire() as conn:
+                    async with conn.cursor() as cursor:
+                        await cursor.execute("SELECT sender FROM messages WHERE message_id = %s", (recalled_msg_id,))
+                        row = await cursor.fetchone()
+                        if row and row[0]:
+                            recalled_nickname = normalizer.loads(row[0]).get("nickname", recalled_nickname)
+            except: pass 
+        return recalled_nickname
+
+    async def _download_media(self, media: list, target_id: str, msg_month: str, image_hashes: list, video_hashes: list) -> bool:
+        """依次下载媒体并把哈希追加到对应列表，至少成功一个时返回 True"""
+        stored = False
+        for kind, url in media:
+            if kind == "video":
+                kind, h = await self._process_video(url, target_id, msg_month)
+            else:
+                h = await self._process_image(url, target_id, msg_month)
+            if h:
+                (image_hashes if kind == "image" else video_hashes).append(h)
+                stored = True
+        return stored
+
     @filter.event_message_type(filter.EventMessageType.ALL)
     async def on_all_message(self, event: AstrMessageEvent):
         if not self.pool: 
@@ -396,171 +664,18 @@ class MySQLPlugin(Star):
             sender_id = str(msg.sender.user_id)
             target_id = str(msg.group_id) if msg.group_id else str(event.session_id)
             
-            # 获取并缓存群名
-            if not hasattr(self, 'group_name_cache'):
-                self.group_name_cache = {}
-                
             group_name = getattr(msg, 'group_name', None)
-            
             if not group_name and msg.group_id:
-                if target_id in self.group_name_cache:
-                    group_name = self.group_name_cache[target_id]
-                else:
-                    group_name = target_id 
-                    try:
-                        if hasattr(event, 'bot') and hasattr(event.bot, 'api'):
-                            api_ret = await event.bot.api.call_action('get_group_info', group_id=int(msg.group_id), no_cache=False)
-                            if isinstance(api_ret, dict):
-                                fetched_name = api_ret.get("data", api_ret).get("group_name")
-                                if fetched_name:
-                                    group_name = fetched_name
-                    except Exception:
-                        pass
-                    
-                    self.group_name_cache[target_id] = group_name
+                group_name = await self._get_group_name(getattr(event, 'bot', None), target_id)
 
             # 更新白名单
-            if sender_id and target_id:
-                if sender_id not in self.qq_group_map:
-                    self.qq_group_map[sender_id] = []
-                if target_id not in self.qq_group_map[sender_id]:
-                    self.qq_group_map[sender_id].append(target_id)
-                    self._save_whitelist()
-
-            image_hashes, video_hashes = [], []
-            comp_types = []
-            
-            raw_data = msg.raw_message
-            if isinstance(raw_data, str):
-                try: 
-                    raw_data = json.loads(raw_data) 
-                except: pass
-            
-            is_notice = False
-            final_message_str = event.message_str.strip()
-            
-            # 处理系统通知 (Notice)
-            if isinstance(raw_data, dict) and raw_data.get("post_type") == "notice":
-                is_notice = True
-                notice_type = raw_data.get("notice_type", "")
-                sub_type = raw_data.get("sub_type", "")
-                
-                if notice_type == "group_upload":
-                    file_info = raw_data.get("file", {})
-                    size_mb = file_info.get("size", 0) / (1024 * 1024)
-                    final_message_str = f"[上传了群文件: {file_info.get('name', '未知文件')} ({size_mb:.2f}MB)]"
-                elif notice_type == "group_admin":
-                    action = "设置" if sub_type == "set" else "取消"
-                    final_message_str = f"[{action}了群管理员]"
-                elif notice_type == "group_decrease":
-                    action = "被踢出" if sub_type in ["kick", "kick_me"] else "主动退出"
-                    final_message_str = f"[有人{action}了群聊]"
-                elif notice_type == "group_increase":
-                    final_message_str = "[有人加入了群聊]"
-                elif notice_type == "group_ban":
-                    action = "禁言" if sub_type == "ban" else "解除禁言"
-                    final_message_str = f"[群内发生了{action}操作]"
-                elif notice_type == "friend_add":
-                    final_message_str = "[新添加了好友]"
-                elif notice_type == "notify":
-                    if sub_type == "poke":
-                        final_message_str = "[拍了拍/戳一戳]"
-                    elif sub_type == "lucky_king":
-                        final_message_str = "[群红包运气王诞生]"
-                    elif sub_type == "honor":
-                        final_message_str = "[群成员荣誉变更]"
-                    else:
-                        final_message_str = f"[群内互动: {sub_type}]"
-                elif notice_type in ["group_recall", "friend_recall"]:
-                    operator_id = raw_data.get("operator_id")
-                    user_id = raw_data.get("user_id")
-                    recalled_msg_id = raw_data.get("message_id")
-                    recalled_nickname = getattr(msg.sender, 'nickname', None) or str(user_id)
-                    
-                    # 从数据库反查被撤回消息的发送者真实昵称
-                    if recalled_msg_id:
-                        try:
-                            async with self.pool.acquire() as conn:
-                                async with conn.cursor() as cursor:
-                                    await cursor.execute("SELECT sender FROM messages WHERE message_id = %s", (str(recalled_msg_id),))
-                                    row = await cursor.fetchone()
-                                    if row and row[0]:
-                                        recalled_nickname = json.loads(row[0]).get("nickname", recalled_nickname)
-                        except: pass 
-
-                    if notice_type == "group_recall" and str(operator_id) != str(user_id):
-                        final_message_str = f"[管理员撤回了 {recalled_nickname} 的消息]"
-                    else:
-                        final_message_str = f"[{recalled_nickname} 撤回了一条消息]"
-                else:
-                    final_message_str = f"[系统通知: {notice_type}]"
-
-            # 处理常规消息与媒体提取
-            if not is_notice:
-                msg_list = raw_data.get("message", raw_data) if isinstance(raw_data, dict) else raw_data
-
-                if isinstance(msg_list, list):
-                    for segment in msg_list:
-                        if not isinstance(segment, dict): continue
-                        
-                        seg_type = segment.get("type", "")
-                        comp_types.append(seg_type) 
-                        
-                        data = segment.get("data", {})
-                        url = data.get("url") or data.get("file") or data.get("file_id")
-                        
-                        if url and isinstance(url, str) and url.startswith("http"):
-                            if seg_type == "video" or (seg_type == "file" and str(data.get("name", url)).lower().endswith(('.mp4', '.mov', '.avi', '.mkv'))):
-                                h = await self._process_video(url, msg_month)
-                                if h: video_hashes.append(h)
-                            elif seg_type == "image":
-                                h = await self._process_image(url, msg_month)
-                                if h: image_hashes.append(h)
-
-                # 框架原生组件兜底
-                if not image_hashes and not video_hashes:
-                    for component in msg.message:
-                        c_type = type(component).__name__.lower()
-                        comp_types.append(c_type)
-                        if c_type == "video":
-                            url = getattr(component, 'url', getattr(component, 'file', getattr(component, 'path', getattr(component, 'file_id', None))))
-                            if url and isinstance(url, str) and url.startswith("http"):
-                                h = await self._process_video(url, msg_month)
-                                if h: video_hashes.append(h)
-
-                # 清理文本中的媒体占位符
-                if image_hashes or video_hashes:
-                    final_message_str = re.sub(r'\[(File|Video|Image|文件|视频|图片|不支持的格式.*?)\]', '', final_message_str, flags=re.IGNORECASE).strip()
-
-                # 空白文本的兜底匹配
-                if not final_message_str and not image_hashes and not video_hashes:
-                    segment_msg_map = {
-                        "record": "[语音消息]",
-                        "video": "[视频获取失败]",
-                        "face": "[QQ表情]",
-                        "mface": "[商城表情]",
-                        "share": "[分享链接]",
-                        "music": "[音乐卡片]",
-                        "reply": "[回复消息]",
-                        "forward": "[合并转发记录]",
-                        "xml": "[卡片消息 (XML)]",
-                        "json": "[卡片消息 (JSON)]",
-                        "poke": "[拍了拍/戳一戳]",
-                        "nudge": "[拍了拍/戳一戳]",
-                        "location": "[位置分享]",
-                        "gift": "[群礼物]"
-                    }
-                    
-                    for c_type in [t.lower() for t in comp_types]:
-                        if c_type in segment_msg_map:
-                            final_message_str = segment_msg_map[c_type]
-                            break
-                            
-                    if not final_message_str:
-                        if comp_types:
-                            final_message_str = f"[{','.join(set(comp_types))} 类型消息]"
-                        else:
-                            final_message_str = "[未知类型消息]"
+            if self._grant_access(sender_id, target_id):
+                self._save_whitelist()
+
+            final_message_str, image_hashes, video_hashes = await self._normalize_message(
+                msg.raw_message, event.message_str, msg.message, target_id, msg_month,
+                fallback_nickname=getattr(msg.sender, 'nickname', None)
+            )
 
             # 组装发件人数据
             sender_data = {
@@ -584,22 +699,325 @@ class MySQLPlugin(Star):
                         event.session_id,
                         msg.group_id or None,
                         group_name,                                          
-                        json.dumps(sender_data, ensure_ascii=False),
+                        normalizer.dumps(sender_data),
                         final_message_str,
-                        json.dumps(msg.raw_message, ensure_ascii=False) if not isinstance(msg.raw_message, str) else msg.raw_message,
-                        json.dumps(image_hashes),
-                        json.dumps(video_hashes),
+                        normalizer.serialize_raw(msg.raw_message),
+                        normalizer.dumps(image_hashes),
+                        normalizer.dumps(video_hashes),
                         msg.timestamp,
                         dt_object,
                         msg_month
                     ))
                 # 提交事务
                 await conn.commit()
+
+            # 入库成功后写入热数据缓存，结构与 /api/messages 返回的单条数据保持一致
+            self.hot_cache.append((msg.group_id, event.session_id), msg.timestamp, msg.message_id, {
+                'message_id': str(msg.message_id),
+                'platform_type': meta.name,
+                'session_id': event.session_id,
+                'group_id': str(msg.group_id) if msg.group_id else None,
+                'sender': sender_data,
+                'message_str': final_message_str,
+                'image_ids': image_hashes,
+                'video_ids': video_hashes,
+                'created_time': dt_object.strftime("%Y-%m-%d %H:%M:%S")
+            })
                 
         except Exception as e:
             import traceback
             logger.error(f"消息入库异常: {e}\n{traceback.format_exc()}")
 
+    # ------------------ 历史消息导入 ------------------
+    _INSERT_MESSAGE_SQL = """
+        INSERT IGNORE INTO messages (message_id, platform_type, self_id, session_id, group_id, group_name,
+                                     sender, message_str, raw_message, image_ids, video_ids,
+                                     timestamp, created_time, month, month_saved)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """
+
+    async def _load_import_checkpoint(self, source_key: str) -> Tuple[str, int]:
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute("SELECT position, imported, finished FROM import_checkpoints WHERE source=%s", (source_key,))
+                row = await cursor.fetchone()
+        # 上次已完整导入则从头开始（已存在的消息会被跳过）
+        if not row or row[2]:
+            return "", 0
+        return row[0] or "", int(row[1] or 0)
+
+    async def _save_import_checkpoint(self, source_key: str, position: str, imported: int, finished: bool = False):
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute("""
+                    INSERT INTO import_checkpoints (source, position, imported, finished, updated_time)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE position = VALUES(position), imported = VALUES(imported),
+                                            finished = VALUES(finished), updated_time = VALUES(updated_time)
+                """, (source_key, position, imported, finished, datetime.datetime.now()))
+
+    async def _load_saved_months(self) -> set:
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute("SELECT DISTINCT month FROM messages WHERE month_saved=1")
+                return {row[0] for row in await cursor.fetchall()}
+
+    @staticmethod
+    def _record_month(record) -> Optional[str]:
+        """导入记录对应的 month 字段，缺少有效时间戳时返回 None"""
+        try:
+            timestamp = int(record.get("time") or 0)
+        except (TypeError, ValueError):
+            return None
+        if timestamp <= 0:
+            return None
+        return datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d")
+
+    async def _iter_export_batches(self, path: Path, position: str):
+        """按批读取导出文件，读取与解析都在线程中进行，产出 (记录, 断点, 跳过的无效行数)。
+
+        NDJSON 的 position 为字节偏移，续传时直接 seek；JSON 文档的 position 为已处理的记录数。
+        """
+        if is_ndjson(path):
+            offset = int(position or 0)
+            while True:
+                records, next_offset, bad_lines = await asyncio.to_thread(
+                    read_ndjson_batch, path, offset, self.import_batch_size)
+                for bad_offset in bad_lines:
+                    logger.warning(f"导入文件 {path} 第 {bad_offset} 字节处的行无法解析，已跳过")
+                if next_offset == offset:
+                    return
+                offset = next_offset
+                yield records, str(offset), len(bad_lines)
+            return
+
+        records = await asyncio.to_thread(load_export_document, path)
+        for start in range(int(position or 0), len(records), self.import_batch_size):
+            end = start + self.import_batch_size
+            yield records[start:end], str(min(end, len(records))), 0
+
+    async def _iter_onebot_history(self, bot, group_id: str, position: str):
+        """通过 get_group_msg_history 从新到旧分页拉取群历史，position 为下一页的起始 message_seq"""
+        seq = position or 0
+        while True:
+            api_ret = await bot.api.call_action('get_group_msg_history', group_id=int(group_id),
+                                                message_seq=seq, count=self.import_batch_size)
+            data = api_ret.get("data", api_ret) if isinstance(api_ret, dict) else {}
+            messages = (data or {}).get("messages") or []
+            # 起始消息本身在上一页已经处理过
+            if seq:
+                messages = [m for m in messages if str(m.get("message_seq", m.get("message_id"))) != str(seq)]
+            if not messages:
+                return
+
+            oldest = min(messages, key=lambda m: int(m.get("time") or 0))
+            next_seq = oldest.get("message_seq", oldest.get("message_id"))
+            yield messages, str(next_seq), 0
+            # message_seq 必须严格递减，否则说明实现忽略了该参数，继续请求只会反复拿到同一页
+            try:
+                if seq and int(next_seq) >= int(seq):
+                    return
+            except (TypeError, ValueError):
+                return
+            if not next_seq:
+                return
+            seq = next_seq
+
+    async def _build_import_row(self, record: dict, bot, platform_name: str, platform_id: str,
+                                saved_months: set) -> Optional[tuple]:
+        """把一条 OneBot 消息事件整理成与 on_all_message 相同的入库行"""
+        if not isinstance(record, dict) or record.get("post_type") not in (None, "message", "message_sent"):
+            return None
+        if record.get("message_id") is None:
+            return None
+
+        timestamp = int(record["time"])
+        dt_object = datetime.datetime.fromtimestamp(timestamp)
+        msg_month = dt_object.strftime("%Y-%m-%d")
+
+        sender = record.get("sender") or {}
+        user_id = sender.get("user_id", record.get("user_id"))
+        group_id = str(record["group_id"]) if record.get("group_id") else None
+        session_id = group_id or str(user_id)
+        group_name = record.get("group_name") or (await self._get_group_name(bot, group_id) if group_id else None)
+
+        segments = message_segments(record)
+        final_message_str, image_hashes, video_hashes = await self._normalize_message(
+            segments, plain_text(segments), None, session_id, msg_month,
+            fallback_nickname=sender.get("nickname")
+        )
+        sender_data = {
+            'user_id': user_id,
+            'nickname': sender.get("nickname") or str(user_id),
+            'platform_id': platform_id
+        }
+        return (
+            str(record["message_id"]),
+            platform_name,
+            str(record.get("self_id", "")),
+            session_id,
+            group_id,
+            group_name,
+            normalizer.dumps(sender_data),
+            final_message_str,
+            normalizer.serialize_raw(record),
+            normalizer.dumps(image_hashes),
+            normalizer.dumps(video_hashes),
+            timestamp,
+            dt_object,
+            msg_month,
+            msg_month in saved_months
+        )
+
+    async def _import_batch(self, records: list, bot, platform_name: str, platform_id: str,
+                            cutoff_month: Optional[str], saved_months: set) -> Tuple[int, set, int]:
+        """导入一批记录，返回 (新写入条数, 涉及的会话, 因缺少时间或超出保留期而跳过的条数)。
+
+        会被下一次自动清理删除的记录（早于 cutoff_month 且所在日期未保存）不导入，也不下载其媒体。
+        """
+        kept, skipped = [], 0
+        for r in records:
+            if not isinstance(r, dict) or r.get("message_id") is None:
+                continue
+            msg_month = self._record_month(r)
+            if msg_month is None or (cutoff_month and msg_month < cutoff_month and msg_month not in saved_months):
+                skipped += 1
+                continue
+            kept.append(r)
+        records = kept
+
+        ids = list({str(r["message_id"]) for r in records})
+        if not ids:
+            return 0, set(), skipped
+
+        # 已入库的消息直接跳过，避免重复下载媒体
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(f"SELECT message_id FROM messages WHERE message_id IN ({','.join(['%s'] * len(ids))})", ids)
+                existing = {row[0] for row in await cursor.fetchall()}
+        pending = {}
+        for r in records:
+            if isinstance(r, dict) and r.get("message_id") is not None and str(r["message_id"]) not in existing:
+                pending.setdefault(str(r["message_id"]), r)
+        if not pending:
+            return 0, set(), skipped
+
+        semaphore = asyncio.Semaphore(self.import_concurrency)
+
+        async def build(record):
+            async with semaphore:
+                try:
+                    return await self._build_import_row(record, bot, platform_name, platform_id, saved_months)
+                except Exception as e:
+                    logger.error(f"导入消息 {record.get('message_id')} 失败: {e}")
+                    return None
+
+        rows = [row for row in await asyncio.gather(*(build(r) for r in pending.values())) if row]
+        if not rows:
+            return 0, set(), skipped
+
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.executemany(self._INSERT_MESSAGE_SQL, rows)
+                inserted = cursor.rowcount
+            await conn.commit()
+
+        whitelist_changed = False
+        for row in rows:
+            sender_id = str(normalizer.loads(row[6]).get("user_id"))
+            whitelist_changed |= self._grant_access(sender_id, row[3])
+        if whitelist_changed:
+            self._save_whitelist()
+
+        return max(inserted, 0), {row[3] for row in rows}, skipped
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("archive_import")
+    async def archive_import_cmd(self, event: AstrMessageEvent, source: str, limit: int = 0):
+        """导入历史消息：source 为群号（通过 OneBot 拉取群历史）或导出的 JSON/NDJSON 文件路径，limit 为本次最多处理条数"""
+        if not self.pool:
+            yield event.plain_result("插件未初始化或数据库不可用")
+            return
+
+        source = source.strip()
+        bot = getattr(event, 'bot', None)
+        if source.isdigit():
+            if bot is None or not hasattr(bot, 'api'):
+                yield event.plain_result("当前平台不支持拉取群历史消息，请改用导出文件导入")
+                return
+            source_key = f"onebot:{source}"
+        else:
+            path = Path(source).expanduser().absolute()
+            if not path.is_file():
+                yield event.plain_result(f"找不到导入文件: {path}")
+                return
+            # 断点主键长度有限，按路径哈希区分不同文件
+            source_key = f"file:{hashlib.sha256(str(path).encode('utf-8')).hexdigest()}"
+
+        if source_key in self.running_imports:
+            yield event.plain_result("该来源的导入任务正在进行中")
+            return
+        self.running_imports.add(source_key)
+
+        meta = event.platform_meta
+        platform_name, platform_id = meta.name, getattr(meta, 'id', 'unknown')
+        try:
+            position, imported = await self._load_import_checkpoint(source_key)
+            cutoff_month = self._retention_cutoff_month()
+            saved_months = await self._load_saved_months()
+            notice = f"开始导入 {source}" + (f"（从断点续传，已导入 {imported} 条）" if position else "")
+            if cutoff_month:
+                notice += (f"\n自动清理保留 {self.keep_days} 天：{cutoff_month} 之前的消息会在下次清理时删除，"
+                           f"因此不会导入（已用 /save_month 保存的日期除外）；缺少时间的消息同样跳过")
+            yield event.plain_result(notice)
+
+            if source_key.startswith("onebot:"):
+                batches = self._iter_onebot_history(bot, source, position)
+            else:
+                batches = self._iter_export_batches(path, position)
+
+            # 群历史从新到旧拉取，翻到保留期之前且没有更早的已保存日期时即可结束
+            stop_before = cutoff_month if cutoff_month and not any(m < cutoff_month for m in saved_months) else None
+
+            processed, invalid, skipped, batch_count, touched = 0, 0, 0, 0, set()
+            exhausted = True
+            async for records, position, bad_lines in batches:
+                inserted, sessions, batch_skipped = await self._import_batch(
+                    records, bot, platform_name, platform_id, cutoff_month, saved_months)
+                imported += inserted
+                processed += len(records)
+                invalid += bad_lines
+                skipped += batch_skipped
+                batch_count += 1
+                touched |= sessions
+                await self._save_import_checkpoint(source_key, position, imported)
+                logger.info(f"导入 {source}: 已处理 {processed} 条，新写入 {inserted} 条")
+
+                if batch_count % 20 == 0:
+                    yield event.plain_result(f"导入 {source} 进行中：本次已处理 {processed} 条，累计新写入 {imported} 条"
+                                             + (f"，跳过超出保留期或缺少时间的 {skipped} 条" if skipped else "")
+                                             + (f"，跳过无法解析的行 {invalid} 条" if invalid else ""))
+                if stop_before and source_key.startswith("onebot:"):
+                    months = [self._record_month(r) for r in records if isinstance(r, dict)]
+                    if months and all(m is None or m < stop_before for m in months):
+                        break
+                if limit and processed >= limit:
+                    exhausted = False
+                    break
+            if exhausted:
+                await self._save_import_checkpoint(source_key, position, imported, finished=True)
+
+            for session_id in touched:
+                self.hot_cache.invalidate(session_id)
+            yield event.plain_result(f"导入 {source} 完成：本次处理 {processed} 条，累计新写入 {imported} 条"
+                                     + (f"，跳过超出保留期或缺少时间的 {skipped} 条" if skipped else "")
+                                     + (f"，跳过无法解析的行 {invalid} 条（详见控制台日志）" if invalid else ""))
+        except Exception as e:
+            logger.error(f"历史消息导入失败: {e}")
+            yield event.plain_result("导入中断，请检查控制台报错；再次执行相同指令即可从断点继续。")
+        finally:
+            self.running_imports.discard(source_key)
+
     # ------------------ 自动清理逻辑 ------------------
     async def _cleanup_loop(self):
         while True:
@@ -609,9 +1027,16 @@ class MySQLPlugin(Star):
                 logger.error(f"自动清理异常: {e}")
             await asyncio.sleep(24*3600)
 
+    def _retention_cutoff_month(self) -> Optional[str]:
+        """早于该月份（YYYY-MM）且未保存的消息会被自动清理，未开启自动清理时返回 None"""
+        if not self.auto_cleanup:
+            return None
+        return (datetime.datetime.now() - datetime.timedelta(days=self.keep_days)).strftime("%Y-%m")
+
     async def _cleanup_old_months(self):
-        now = datetime.datetime.now()
-        cutoff_month = (now - datetime.timedelta(days=self.keep_days)).strftime("%Y-%m")
+        cutoff_month = self._retention_cutoff_month()
+        if not cutoff_month:
+            return
 
         async with self.pool.acquire() as conn:
             async with conn.cursor() as cursor:
@@ -632,6 +1057,11 @@ class MySQLPlugin(Star):
                     await cursor.execute("DELETE FROM messages WHERE month=%s", (month,))
                     logger.info(f"自动删除未保存月份消息: {month}")
 
+                if months_to_delete:
+                    self.hot_cache.invalidate()
+
+                await cursor.execute("DELETE FROM media_quota WHERE month < %s", (cutoff_month,))
+
     
     async def _delete_asset_if_unused(self, table: str, hash_column: str, msg_ids_column: str, asset_hash: str):
         async with self.pool.acquire() as conn:
@@ -645,13 +1075,95 @@ class MySQLPlugin(Star):
                         file_path = row[0]
                         if os.path.exists(file_path):
                             os.remove(file_path)
-                            try:
-                                folder_path = os.path.dirname(file_path)
-                                os.rmdir(folder_path)
-                            except OSError:
-                                pass
+                            base_save_path = self.image_save_path if table == "image_assets" else self.video_save_path
+                            prune_empty_dirs(os.path.dirname(file_path), base_save_path)
                     await cursor.execute(f"DELETE FROM {table} WHERE {hash_column}=%s", (asset_hash,))
 
+    # ------------------ 媒体完整性巡检 ------------------
+    async def _scrub_loop(self):
+        while True:
+            await asyncio.sleep(self.scrub_interval_hours * 3600)
+            if self.scrubber.lock.locked():
+                continue
+            try:
+                async with self.scrubber.lock:
+                    issue_count = 0
+                    async for issue in self.scrubber.scan(repair=False):
+                        issue_count += 1
+                        logger.warning(f"媒体巡检发现问题: {self._format_scrub_issue(issue)}")
+                    logger.info(f"媒体巡检完成，共发现 {issue_count} 个问题")
+            except Exception as e:
+                logger.error(f"媒体巡检异常: {e}")
+
+    @staticmethod
+    def _format_scrub_issue(issue: dict) -> str:
+        text = f"[{issue['kind']}] {issue['table']} {issue.get('hash') or '-'} {issue['path']}"
+        if issue.get('detail'):
+            text += f" ({issue['detail']})"
+        if issue.get('repair'):
+            text += f" => {issue['repair']}"
+        return text
+
+    async def _stream_scrub_results(self, event: AstrMessageEvent, results, title: str, batch_size: int = 20):
+        """逐批把巡检/迁移结果推送给指令发起者"""
+        batch, counts = [], {}
+        async for item in results:
+            counts[item['kind']] = counts.get(item['kind'], 0) + 1
+            if item['kind'] == "migrated":
+                continue
+            line = self._format_scrub_issue(item)
+            logger.info(f"{title}: {line}")
+            batch.append(line)
+            if len(batch) >= batch_size:
+                yield event.plain_result("\n".join(batch))
+                batch = []
+        if batch:
+            yield event.plain_result("\n".join(batch))
+
+        summary = "，".join(f"{k} {v}" for k, v in counts.items()) or "未发现问题"
+        yield event.plain_result(f"{title}完成：{summary}")
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("media_migrate")
+    async def media_migrate_cmd(self, event: AstrMessageEvent):
+        """将旧的按日期分目录的媒体文件迁移为按哈希分片的内容寻址布局"""
+        if not self.scrubber:
+            yield event.plain_result("插件未初始化或数据库不可用")
+            return
+        if self.scrubber.lock.locked():
+            yield event.plain_result("已有迁移或巡检任务在运行，请稍后再试")
+            return
+
+        async with self.scrubber.lock:
+            yield event.plain_result("开始迁移媒体文件，迁移期间 WebUI 仍可正常访问...")
+            try:
+                async for result in self._stream_scrub_results(event, self.scrubber.migrate(), "媒体迁移"):
+                    yield result
+            except Exception as e:
+                logger.error(f"媒体迁移失败: {e}")
+                yield event.plain_result("媒体迁移失败，请检查控制台报错。")
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("media_scrub")
+    async def media_scrub_cmd(self, event: AstrMessageEvent, mode: str = ""):
+        """巡检媒体文件：缺失、孤儿文件与哈希不符 (追加 repair 参数同时修复记录)"""
+        if not self.scrubber:
+            yield event.plain_result("插件未初始化或数据库不可用")
+            return
+        if self.scrubber.lock.locked():
+            yield event.plain_result("已有迁移或巡检任务在运行，请稍后再试")
+            return
+
+        repair = mode.strip().lower() == "repair"
+        async with self.scrubber.lock:
+            yield event.plain_result(f"开始巡检媒体文件{'（修复模式）' if repair else ''}...")
+            try:
+                async for result in self._stream_scrub_results(event, self.scrubber.scan(repair=repair), "媒体巡检"):
+                    yield result
+            except Exception as e:
+                logger.error(f"媒体巡检失败: {e}")
+                yield event.plain_result("媒体巡检失败，请检查控制台报错。")
+
     # ------------------ 指令：保存整个月 ------------------
     @filter.command("save_month")
     async def save_month_cmd(self, event: AstrMessageEvent, month: str):
@@ -0,0 +1,297 @@
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from aiomysql import DictCursor
+
+# 资产表 -> 哈希列
+ASSET_TABLES = {
+    "image_assets": "image_hash",
+    "video_assets": "video_hash",
+}
+
+TEMP_DIR_NAME = ".tmp"
+QUARANTINE_DIR_NAME = ".quarantine"
+_SKIP_DIRS = {TEMP_DIR_NAME, QUARANTINE_DIR_NAME}
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def sniff_ext(asset_table: str, header_bytes: bytes) -> str:
+    """根据文件头判断扩展名"""
+    if asset_table == "image_assets":
+        if header_bytes[:4].startswith(b'\x89PNG'): return ".png"
+        if header_bytes[:3].startswith(b'GIF'): return ".gif"
+        if header_bytes[:4].startswith(b'RIFF') and header_bytes[8:12] == b'WEBP': return ".webp"
+        return ".jpg"
+    if asset_table == "video_assets":
+        return ".mp4"
+    return ".dat"
+
+
+def shard_path(base_save_path: Path, sha256_hash: str, file_ext: str) -> Path:
+    """内容寻址路径：<base>/ab/cd/<sha256>.ext"""
+    return base_save_path / sha256_hash[:2] / sha256_hash[2:4] / f"{sha256_hash}{file_ext}"
+
+
+def hash_file(path, chunk_size: int = 1024 * 1024) -> Tuple[str, int]:
+    """同步计算文件的 sha256 与大小（请放在线程中调用）"""
+    sha256_obj = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            sha256_obj.update(chunk)
+            size += len(chunk)
+    return sha256_obj.hexdigest(), size
+
+
+def prune_empty_dirs(folder, stop_at) -> None:
+    """自下而上删除空目录，直到 stop_at（不含）为止"""
+    folder, stop_at = Path(folder), Path(stop_at)
+    while folder != stop_at and stop_at in folder.parents:
+        try:
+            folder.rmdir()
+        except OSError:
+            return
+        folder = folder.parent
+
+
+def place_file(src: Path, dst: Path) -> None:
+    """把文件放到新位置但保留原文件：同盘硬链接，跨盘复制"""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if dst.exists():
+        return
+    try:
+        os.link(src, dst)
+    except OSError:
+        tmp = dst.with_name(dst.name + ".part")
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+
+
+def same_file(a, b) -> bool:
+    """两个路径是否指向同一个文件（兼容软链接、相对路径等写法差异）"""
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return False
+
+
+def quarantine(path: Path, base_save_path: Path) -> Path:
+    """把可疑文件移入隔离目录而不是直接删除，文件名追加随机后缀以免覆盖之前隔离的同名文件"""
+    target = base_save_path / QUARANTINE_DIR_NAME / f"{path.stem}.{uuid.uuid4().hex[:8]}{path.suffix}"
+    target.parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(str(path), str(target))
+    return target
+
+
+# 截取封面时允许的协议与容器格式：只读 http(s)，不接受 HLS / concat 等会再去引用其他 URL 或本地文件的格式
+POSTER_PROTOCOLS = "http,https,tcp,tls"
+POSTER_FORMATS = "mov,matroska,avi,flv,mpegts"
+
+
+async def extract_poster_frame(ffmpeg_path: str, source: str, poster_path: Path, timeout: float = 60) -> bool:
+    """调用本地 ffmpeg 截取视频首帧为 jpg（source 为 http(s) URL），成功返回 True"""
+    poster_path.parent.mkdir(parents=True, exist_ok=True)
+    proc = await asyncio.create_subprocess_exec(
+        ffmpeg_path, "-y", "-loglevel", "error",
+        "-protocol_whitelist", POSTER_PROTOCOLS, "-format_whitelist", POSTER_FORMATS,
+        "-t", "5", "-i", str(source),
+        "-frames:v", "1", "-q:v", "3", str(poster_path),
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+    try:
+        await asyncio.wait_for(proc.wait(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return False
+    return proc.returncode == 0 and poster_path.exists() and poster_path.stat().st_size > 0
+
+
+class MediaScrubber:
+    """媒体文件完整性巡检与内容寻址迁移。
+
+    scan()/migrate() 均为异步生成器，逐条产出结果；每处理一个文件都会让出事件循环并按
+    files_per_second 限速，哈希计算放在线程中执行，避免影响消息入库与 WebUI。
+    """
+
+    def __init__(self, pool, base_paths: Dict[str, Path], files_per_second: float = 20):
+        self.pool = pool
+        self.base_paths = base_paths
+        self._resolved = {table: Path(base).resolve() for table, base in base_paths.items()}
+        self.delay = 1.0 / files_per_second if files_per_second and files_per_second > 0 else 0
+        self.lock = asyncio.Lock()
+
+    async def _throttle(self):
+        await asyncio.sleep(self.delay)
+
+    async def _iter_rows(self, table: str, batch: int = 500) -> AsyncIterator[dict]:
+        hash_col = ASSET_TABLES[table]
+        last = ""
+        while True:
+            async with self.pool.acquire() as conn:
+                async with conn.cursor(DictCursor) as cursor:
+                    await cursor.execute(
+                        f"SELECT {hash_col} AS h, file_path, file_size FROM {table} WHERE {hash_col} > %s ORDER BY {hash_col} LIMIT %s",
+                        (last, batch))
+                    rows = await cursor.fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row
+            last = rows[-1]['h']
+
+    async def _execute(self, sql: str, params: tuple):
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(sql, params)
+
+    def _shared_base(self, table: str) -> Optional[str]:
+        """与其他资产表共用同一目录时返回对方表名，此时无法判断孤儿文件归属"""
+        for other, resolved in self._resolved.items():
+            if other != table and resolved == self._resolved[table]:
+                return other
+        return None
+
+    def _iter_disk_files(self, table: str):
+        # 其他资产表的目录嵌套在本目录下时跳过该子树，避免把对方的文件当成孤儿
+        own = self._resolved[table]
+        nested = {p for t, p in self._resolved.items() if t != table and p != own and p.is_relative_to(own)}
+        for root, dirs, files in os.walk(self.base_paths[table]):
+            dirs[:] = [d for d in dirs
+                       if d not in _SKIP_DIRS and not (nested and (Path(root) / d).resolve() in nested)]
+            for name in files:
+                yield Path(root) / name
+
+    # ------------------ 迁移到内容寻址布局 ------------------
+    async def migrate(self) -> AsyncIterator[dict]:
+        """把旧的按日期分目录存放的文件迁移到 ab/cd/<sha256>.ext。
+
+        先把文件放到新位置，再更新记录，最后删除旧文件，迁移期间 WebUI 始终能读到文件。
+        """
+        for table, base in self.base_paths.items():
+            hash_col = ASSET_TABLES[table]
+            async for row in self._iter_rows(table):
+                old_path = Path(row['file_path'])
+                new_path = shard_path(base, row['h'], old_path.suffix or ".dat")
+                if old_path == new_path:
+                    continue
+                await self._throttle()
+
+                if not old_path.exists():
+                    yield {"kind": "skip_missing", "table": table, "hash": row['h'], "path": str(old_path)}
+                    continue
+                try:
+                    await asyncio.to_thread(place_file, old_path, new_path)
+                    await self._execute(f"UPDATE {table} SET file_path=%s WHERE {hash_col}=%s", (str(new_path), row['h']))
+                    old_path.unlink()
+                    prune_empty_dirs(old_path.parent, base)
+                    yield {"kind": "migrated", "table": table, "hash": row['h'], "path": str(new_path)}
+                except Exception as e:
+                    yield {"kind": "error", "table": table, "hash": row['h'], "path": str(old_path), "detail": str(e)}
+
+    # ------------------ 完整性巡检 ------------------
+    async def scan(self, repair: bool = False) -> AsyncIterator[dict]:
+        """检查文件缺失、哈希不符与孤儿文件，repair=True 时同时修复记录。
+
+        - missing：记录存在但文件不存在 -> 若内容寻址路径下有文件则改指向，否则删除记录
+        - mismatch：文件内容与记录哈希不符 -> 文件移入隔离目录并删除记录
+        - orphan：磁盘上有文件但没有任何记录 -> 文件名即哈希且内容吻合则重新登记，否则移入隔离目录
+        """
+        for table, base in self.base_paths.items():
+            hash_col = ASSET_TABLES[table]
+            known_paths = set()
+
+            async for row in self._iter_rows(table):
+                await self._throttle()
+                path = Path(row['file_path'])
+                known_paths.add(str(path))
+                issue = {"table": table, "hash": row['h'], "path": str(path)}
+
+                if not path.exists():
+                    issue["kind"] = "missing"
+                    if repair:
+                        fallback = shard_path(base, row['h'], path.suffix or ".dat")
+                        if fallback.exists() and (await asyncio.to_thread(hash_file, fallback))[0] == row['h']:
+                            await self._execute(f"UPDATE {table} SET file_path=%s WHERE {hash_col}=%s", (str(fallback), row['h']))
+                            known_paths.add(str(fallback))
+                            issue["repair"] = f"relinked -> {fallback}"
+                        else:
+                            await self._execute(f"DELETE FROM {table} WHERE {hash_col}=%s", (row['h'],))
+                            issue["repair"] = "record deleted"
+                    yield issue
+                    continue
+
+                try:
+                    actual_hash, _ = await asyncio.to_thread(hash_file, path)
+                except OSError as e:
+                    issue.update(kind="error", detail=str(e))
+                    yield issue
+                    continue
+
+                if actual_hash != row['h']:
+                    issue.update(kind="mismatch", actual=actual_hash)
+                    if repair:
+                        moved = await asyncio.to_thread(quarantine, path, base)
+                        await self._execute(f"DELETE FROM {table} WHERE {hash_col}=%s", (row['h'],))
+                        issue["repair"] = f"quarantined -> {moved}"
+                    yield issue
+
+            shared = self._shared_base(table)
+            if shared:
+                yield {"kind": "error", "table": table, "hash": None, "path": str(base),
+                       "detail": f"与 {shared} 使用同一目录，已跳过孤儿文件检查，请为图片和视频配置不同的保存路径"}
+                continue
+
+            for path in self._iter_disk_files(table):
+                if str(path) in known_paths:
+                    continue
+                await self._throttle()
+                # 巡检期间新入库的文件：记录是在读取记录列表之后才写入的
+                recorded = await self._recorded_path(table, path.stem) if _SHA256_RE.match(path.stem) else None
+                if recorded is not None and (recorded == str(path) or same_file(recorded, path)):
+                    continue
+                issue = {"kind": "orphan", "table": table, "hash": None, "path": str(path)}
+                if repair:
+                    issue["repair"] = await self._repair_orphan(table, base, path, recorded)
+                yield issue
+
+    async def _recorded_path(self, table: str, asset_hash: str) -> Optional[str]:
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(f"SELECT file_path FROM {table} WHERE {ASSET_TABLES[table]}=%s", (asset_hash,))
+                row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def _repair_orphan(self, table: str, base: Path, path: Path, recorded: Optional[str]) -> str:
+        """recorded 为同哈希记录指向的路径（无记录时为 None）"""
+        hash_col = ASSET_TABLES[table]
+        stem = path.stem
+        # 记录指向的文件仍然存在且是另一份文件时，这里才是多余的副本
+        recorded_alive = recorded is not None and os.path.exists(recorded)
+        if _SHA256_RE.match(stem) and not recorded_alive:
+            actual_hash, size = await asyncio.to_thread(hash_file, path)
+            if actual_hash == stem:
+                target = shard_path(base, stem, path.suffix or ".dat")
+                if target != path:
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(path, target)
+                    prune_empty_dirs(path.parent, base)
+                if recorded is None:
+                    await self._execute(
+                        f"INSERT IGNORE INTO {table} ({hash_col}, file_path, file_size, created_time) VALUES (%s, %s, %s, NOW())",
+                        (stem, str(target), size))
+                    return f"registered -> {target}"
+                await self._execute(f"UPDATE {table} SET file_path=%s WHERE {hash_col}=%s", (str(target), stem))
+                return f"relinked -> {target}"
+        moved = await asyncio.to_thread(quarantine, path, base)
+        prune_empty_dirs(path.parent, base)
+        return f"quarantined -> {moved}"
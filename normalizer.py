@@ -0,0 +1,281 @@
+"""消息规范化：把原始消息 / 通知整理成入库文本并找出需要下载的媒体。
+
+本模块只做纯计算，不访问数据库与网络，也不依赖 AstrBot，可单独导入测试与压测。
+"""
+import json
+import re
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# ------------------ JSON 编解码（优先使用 orjson） ------------------
+# json.dumps 带参数调用时每次都会新建 JSONEncoder，这里复用同一个实例
+_json_encode = json.JSONEncoder(ensure_ascii=False).encode
+
+if orjson is not None:
+    def loads(data):
+        return orjson.loads(data)
+
+    def dumps(obj) -> str:
+        try:
+            return orjson.dumps(obj).decode("utf-8")
+        except TypeError:
+            # orjson 不支持的类型（如非字符串键）退回标准库
+            return _json_encode(obj)
+else:
+    loads = json.loads
+    dumps = _json_encode
+
+
+def parse_raw(raw_data):
+    """raw_message 为字符串时尝试解析为 JSON，解析失败原样返回"""
+    if isinstance(raw_data, (str, bytes)):
+        try:
+            return loads(raw_data)
+        except ValueError:
+            return raw_data
+    return raw_data
+
+
+def serialize_raw(raw_message) -> str:
+    """入库用的 raw_message：已经是字符串时直接复用，不再重复序列化"""
+    if isinstance(raw_message, str):
+        return raw_message
+    return dumps(raw_message)
+
+
+# ------------------ 系统通知 ------------------
+def _notice_group_upload(raw: dict, sub_type: str) -> str:
+    file_info = raw.get("file") or {}
+    size_mb = (file_info.get("size") or 0) / (1024 * 1024)
+    return f"[上传了群文件: {file_info.get('name', '未知文件')} ({size_mb:.2f}MB)]"
+
+
+def _notice_group_admin(raw: dict, sub_type: str) -> str:
+    return f"[{'设置' if sub_type == 'set' else '取消'}了群管理员]"
+
+
+def _notice_group_decrease(raw: dict, sub_type: str) -> str:
+    return f"[有人{'被踢出' if sub_type in ('kick', 'kick_me') else '主动退出'}了群聊]"
+
+
+def _notice_group_ban(raw: dict, sub_type: str) -> str:
+    return f"[群内发生了{'禁言' if sub_type == 'ban' else '解除禁言'}操作]"
+
+
+_NOTIFY_TEXT = {
+    "poke": "[拍了拍/戳一戳]",
+    "lucky_king": "[群红包运气王诞生]",
+    "honor": "[群成员荣誉变更]",
+}
+
+
+def _notice_notify(raw: dict, sub_type: str) -> str:
+    return _NOTIFY_TEXT.get(sub_type) or f"[群内互动: {sub_type}]"
+
+
+NOTICE_HANDLERS: Dict[str, Callable[[dict, str], str]] = {
+    "group_upload": _notice_group_upload,
+    "group_admin": _notice_group_admin,
+    "group_decrease": _notice_group_decrease,
+    "group_increase": lambda raw, sub_type: "[有人加入了群聊]",
+    "group_ban": _notice_group_ban,
+    "friend_add": lambda raw, sub_type: "[新添加了好友]",
+    "notify": _notice_notify,
+}
+
+RECALL_NOTICES = frozenset(("group_recall", "friend_recall"))
+
+
+def is_notice(raw) -> bool:
+    return isinstance(raw, dict) and raw.get("post_type") == "notice"
+
+
+def recalled_message_id(raw: dict) -> Optional[str]:
+    """撤回通知中被撤回消息的 ID，其余通知返回 None"""
+    if raw.get("notice_type") in RECALL_NOTICES and raw.get("message_id"):
+        return str(raw["message_id"])
+    return None
+
+
+def describe_notice(raw: dict, recalled_nickname: Optional[str] = None) -> str:
+    """把通知事件转换为一行描述文本；撤回通知需由调用方提供被撤回者的昵称"""
+    notice_type = raw.get("notice_type", "")
+    sub_type = raw.get("sub_type", "")
+
+    handler = NOTICE_HANDLERS.get(notice_type)
+    if handler is not None:
+        return handler(raw, sub_type)
+
+    if notice_type in RECALL_NOTICES:
+        user_id = raw.get("user_id")
+        nickname = recalled_nickname or str(user_id)
+        if notice_type == "group_recall" and str(raw.get("operator_id")) != str(user_id):
+            return f"[管理员撤回了 {nickname} 的消息]"
+        return f"[{nickname} 撤回了一条消息]"
+
+    return f"[系统通知: {notice_type}]"
+
+
+# ------------------ 消息段 ------------------
+VIDEO_FILE_EXTS = ('.mp4', '.mov', '.avi', '.mkv')
+
+
+def _segment_url(data: dict) -> Optional[str]:
+    url = data.get("url") or data.get("file") or data.get("file_id")
+    if isinstance(url, str) and url.startswith("http"):
+        return url
+    return None
+
+
+def _file_media_kind(data: dict, url: str) -> Optional[str]:
+    return "video" if str(data.get("name", url)).lower().endswith(VIDEO_FILE_EXTS) else None
+
+
+# 消息段类型 -> 媒体类型判断
+SEGMENT_MEDIA: Dict[str, Callable[[dict, str], Optional[str]]] = {
+    "image": lambda data, url: "image",
+    "video": lambda data, url: "video",
+    "file": _file_media_kind,
+}
+
+# 空白文本时按消息段类型给出的兜底描述
+SEGMENT_TEXT: Dict[str, str] = {
+    "record": "[语音消息]",
+    "video": "[视频获取失败]",
+    "face": "[QQ表情]",
+    "mface": "[商城表情]",
+    "share": "[分享链接]",
+    "music": "[音乐卡片]",
+    "reply": "[回复消息]",
+    "forward": "[合并转发记录]",
+    "xml": "[卡片消息 (XML)]",
+    "json": "[卡片消息 (JSON)]",
+    "poke": "[拍了拍/戳一戳]",
+    "nudge": "[拍了拍/戳一戳]",
+    "location": "[位置分享]",
+    "gift": "[群礼物]",
+}
+
+_MEDIA_PLACEHOLDER_RE = re.compile(r'\[(File|Video|Image|文件|视频|图片|不支持的格式.*?)\]', re.IGNORECASE)
+
+
+class ParsedSegments(NamedTuple):
+    comp_types: List[str]
+    # [(媒体类型 "image"/"video", url)]，顺序与消息段一致
+    media: List[Tuple[str, str]]
+
+
+def parse_segments(raw) -> ParsedSegments:
+    """遍历 OneBot 消息段，返回出现过的段类型与需要下载的媒体"""
+    msg_list = raw.get("message", raw) if isinstance(raw, dict) else raw
+    comp_types, media = [], []
+    if not isinstance(msg_list, list):
+        return ParsedSegments(comp_types, media)
+
+    media_kinds = SEGMENT_MEDIA
+    for segment in msg_list:
+        if not isinstance(segment, dict):
+            continue
+        seg_type = segment.get("type", "")
+        comp_types.append(seg_type)
+
+        kind_of = media_kinds.get(seg_type)
+        if kind_of is None:
+            continue
+        data = segment.get("data") or {}
+        url = _segment_url(data)
+        if url:
+            kind = kind_of(data, url)
+            if kind:
+                media.append((kind, url))
+
+    return ParsedSegments(comp_types, media)
+
+
+def parse_components(components) -> ParsedSegments:
+    """框架原生消息组件兜底：只提取视频"""
+    comp_types, media = [], []
+    for component in components or ():
+        c_type = type(component).__name__.lower()
+        comp_types.append(c_type)
+        if c_type == "video":
+            url = getattr(component, 'url', getattr(component, 'file', getattr(component, 'path', getattr(component, 'file_id', None))))
+            if isinstance(url, str) and url.startswith("http"):
+                media.append(("video", url))
+    return ParsedSegments(comp_types, media)
+
+
+def finalize_text(message_str: str, comp_types: List[str], has_media: bool) -> str:
+    """清理媒体占位符，并为空白消息生成兜底描述"""
+    text = message_str
+    if has_media:
+        return _MEDIA_PLACEHOLDER_RE.sub('', text).strip()
+    if text:
+        return text
+
+    segment_text = SEGMENT_TEXT
+    for c_type in comp_types:
+        hit = segment_text.get(str(c_type).lower())
+        if hit:
+            return hit
+    if comp_types:
+        return f"[{','.join(dict.fromkeys(str(t) for t in comp_types))} 类型消息]"
+    return "[未知类型消息]"
+
+
+# 规范化流程中需要调用方完成的外部操作
+STEP_RECALL = "recall"  # 载荷为被撤回消息 ID（可能为 None），调用方回送被撤回者昵称
+STEP_MEDIA = "media"    # 载荷为 [(媒体类型, url)]，调用方下载后回送是否至少有一个成功
+
+
+def normalize_steps(raw_data, message_str: str = "", components=None):
+    """规范化流程的唯一实现：通知 -> 消息段 -> 框架组件兜底 -> 文本收尾。
+
+    这是一个生成器，本身不做任何 I/O：需要查昵称或下载媒体时 yield (步骤, 载荷)，由调用方完成后
+    用 send() 回送结果，流程结束时 StopIteration.value 为最终入库文本。
+    """
+    raw = parse_raw(raw_data)
+
+    if is_notice(raw):
+        recalled_nickname = None
+        if raw.get("notice_type") in RECALL_NOTICES:
+            recalled_nickname = yield STEP_RECALL, recalled_message_id(raw)
+        return describe_notice(raw, recalled_nickname)
+
+    parsed = parse_segments(raw)
+    comp_types = parsed.comp_types
+    has_media = False
+    if parsed.media:
+        has_media = bool((yield STEP_MEDIA, parsed.media))
+
+    # 消息段里的媒体全部失败（或没有）时，再尝试框架原生组件
+    if not has_media and components:
+        fallback = parse_components(components)
+        comp_types = comp_types + fallback.comp_types
+        if fallback.media:
+            has_media = bool((yield STEP_MEDIA, fallback.media))
+
+    return finalize_text((message_str or "").strip(), comp_types, has_media)
+
+
+def normalize_offline(raw_data, message_str: str = "", components=None,
+                      recalled_nickname: Optional[str] = None) -> Tuple[str, List[Tuple[str, str]]]:
+    """同步驱动 normalize_steps（假定媒体均下载成功），返回 (文本, 媒体列表)，用于测试与压测"""
+    steps = normalize_steps(raw_data, message_str, components)
+    media = []
+    reply = None
+    try:
+        while True:
+            step, payload = steps.send(reply)
+            if step == STEP_MEDIA:
+                media.extend(payload)
+                reply = True
+            else:
+                reply = recalled_nickname
+    except StopIteration as done:
+        return done.value, media